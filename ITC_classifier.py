@@ -1,9 +1,18 @@
 import pandas as pd
+import numpy as np
 import json
 import os,io
 import requests
 import re
-from typing import Dict, Any, List
+import math
+import string
+import threading
+import time
+import uuid
+from collections import Counter, OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Dict, Any, List, Optional
 import streamlit as st
 
 # --- CONFIGURATION ---
@@ -12,6 +21,27 @@ AZURE_OPENAI_API_KEY =st.secrets["AZURE_OPENAI_API_KEY"]
 #AZURE_OPENAI_API_KEY = os.environ.get('AZURE_OPENAI_API_KEY')
 AZURE_OPENAI_ENDPOINT = "https://gta-openai.openai.azure.com/"
 AZURE_OPENAI_DEPLOYMENT_NAME = "GTA-OPENAI"
+AZURE_OPENAI_MAX_TOKENS = 500
+
+# --- BULK RUN SETTINGS ---
+# Used by the request scheduler, the bulk loop and the pre-flight estimator. Keep the
+# quota and pricing values in line with the Azure deployment.
+SCHEDULER_MAX_CONCURRENCY = 6  # Calls in flight to the deployment across all users
+INTERACTIVE_RESERVE_SLOTS = 2  # In-flight slots that bulk jobs can't use
+# Quota held back from bulk jobs, sized in single-item lookups. Each lookup sends the full
+# rules (~6.5k prompt tokens) and reserves AZURE_OPENAI_MAX_TOKENS, so ~7k tokens per call.
+# With 4 lookups (28k of the 80k TPM) that many can start at once while a bulk job saturates
+# the quota; each further lookup waits ~5s for 7k tokens to refill.
+INTERACTIVE_RESERVE_LOOKUPS = 4
+INTERACTIVE_LOOKUP_TOKENS = 7000
+BULK_CONCURRENCY = 4  # Worker threads per bulk job
+AZURE_OPENAI_TPM_QUOTA = 80000  # Tokens per minute
+AZURE_OPENAI_RPM_QUOTA = 480  # Requests per minute
+AZURE_OPENAI_AVG_LATENCY_SECONDS = 8.0  # Typical time for one completion
+EST_COMPLETION_TOKENS = 250  # Typical answer length, capped by AZURE_OPENAI_MAX_TOKENS; used for cost only
+CHARS_PER_TOKEN = 4.0  # Rough characters-per-token ratio for English prompts
+PROMPT_COST_PER_1K_TOKENS = 0.005  # USD
+COMPLETION_COST_PER_1K_TOKENS = 0.015  # USD
 
 # --- FILE PATHS ---
 base_path = os.getcwd()
@@ -23,6 +53,7 @@ os.makedirs(os.path.join(base_path, "output"), exist_ok=True)
 
 EXCEL_RULE_BOOK_PATH = os.path.join(base_path, "rulebook.xlsx")
 PROCESSED_RULES_JSON_PATH = os.path.join(base_path, "rules.json")
+BULK_RULES_JSON_PATH = os.path.join(base_path, "Rules", "rules.json")
 HSN_TARIFF_CSV_PATH = os.path.join(base_path, "pv_bcd_tariff_202506231736.csv")
 
 INPUT_DATA_EXCEL_PATH = os.path.join(base_path, "PO and Work Order Data 1.xlsx")
@@ -30,19 +61,209 @@ OUTPUT_DATA_EXCEL_PATH = os.path.join(base_path, "classified_output.xlsx")
 
 # --- GLOBAL DATA ---
 HSN_TARIFF_DATA = None
+HSN_DESC_LOOKUP = {}
+
+
+# --- REQUEST SCHEDULER ---
+
+PRIORITY_INTERACTIVE = "interactive"
+PRIORITY_BULK = "bulk"
+
+
+class _ScheduledRequest:
+    """A request waiting for, or holding, a slot in the RequestScheduler."""
+
+    def __init__(self, priority: str, job_id: Optional[str], tokens: int):
+        self.priority = priority
+        self.job_id = job_id
+        self.tokens = tokens
+        self.enqueued_at = time.monotonic()
+        self.wait_seconds = 0.0
+        self.granted = threading.Event()
+
+
+class RequestScheduler:
+    """
+    Shared gate in front of the Azure OpenAI deployment.
+    Interactive requests always go first. Bulk requests take turns across jobs, and can
+    only use the slots and RPM/TPM quota left after the interactive reserve.
+    """
+
+    def __init__(self, max_concurrency: int, rpm_quota: int, tpm_quota: int,
+                 reserve_slots: int, reserve_requests: int, reserve_tokens: int):
+        self.max_concurrency = max_concurrency
+        self.rpm_quota = rpm_quota
+        self.tpm_quota = tpm_quota
+        self.reserve_requests = min(reserve_requests, rpm_quota - 1)  # Bulk always needs one request
+        self.reserve_tokens = min(reserve_tokens, tpm_quota)
+        self.bulk_max_concurrency = max(1, max_concurrency - reserve_slots)
+        self.bulk_rpm_quota = rpm_quota - self.reserve_requests
+        self.bulk_tpm_quota = tpm_quota - self.reserve_tokens
+
+        self._lock = threading.Lock()
+        self._interactive_queue = deque()
+        self._bulk_queues = OrderedDict()  # job_id -> deque; rotated after each grant for a fair share
+        self._in_flight = {PRIORITY_INTERACTIVE: 0, PRIORITY_BULK: 0}
+        self._bulk_in_flight_by_job = Counter()
+        self._requests_available = float(rpm_quota)
+        self._tokens_available = float(tpm_quota)
+        self._last_refill = time.monotonic()
+        self._wait_times = {PRIORITY_INTERACTIVE: deque(maxlen=500), PRIORITY_BULK: deque(maxlen=500)}
+        self._completed = {PRIORITY_INTERACTIVE: 0, PRIORITY_BULK: 0}
+
+    def _refill(self):
+        """Tops up the per-minute request and token budgets for the time since the last refill."""
+        now = time.monotonic()
+        elapsed = now - self._last_refill
+        self._last_refill = now
+        self._requests_available = min(self.rpm_quota, self._requests_available + elapsed * self.rpm_quota / 60)
+        self._tokens_available = min(self.tpm_quota, self._tokens_available + elapsed * self.tpm_quota / 60)
+
+    def _next_request(self) -> Optional[_ScheduledRequest]:
+        if self._interactive_queue:
+            return self._interactive_queue[0]
+        for queue in self._bulk_queues.values():
+            return queue[0]
+        return None
+
+    def _charge(self, request: _ScheduledRequest) -> int:
+        """Tokens a request takes from the budget, capped so that it always fits eventually."""
+        if request.priority == PRIORITY_INTERACTIVE:
+            return min(request.tokens, self.tpm_quota)
+        return min(request.tokens, self.bulk_tpm_quota)
+
+    def _can_start(self, request: _ScheduledRequest) -> bool:
+        # Bulk must leave the interactive reserve untouched; interactive may use everything.
+        if request.priority == PRIORITY_INTERACTIVE:
+            reserve_requests, reserve_tokens, slot_limit = 0, 0, self.max_concurrency
+        else:
+            reserve_requests, reserve_tokens, slot_limit = (self.reserve_requests, self.reserve_tokens,
+                                                            self.bulk_max_concurrency)
+        if self._in_flight[request.priority] >= slot_limit or sum(self._in_flight.values()) >= self.max_concurrency:
+            return False
+        return (self._requests_available - 1 >= reserve_requests
+                and self._tokens_available - self._charge(request) >= reserve_tokens)
+
+    def _dispatch(self):
+        """Grants slots to waiting requests in priority order. Must be called with the lock held."""
+        self._refill()
+        while True:
+            request = self._next_request()
+            if request is None or not self._can_start(request):
+                return
+            if request.priority == PRIORITY_INTERACTIVE:
+                self._interactive_queue.popleft()
+            else:
+                queue = self._bulk_queues[request.job_id]
+                queue.popleft()
+                if queue:
+                    self._bulk_queues.move_to_end(request.job_id)
+                else:
+                    del self._bulk_queues[request.job_id]
+            self._requests_available -= 1
+            self._tokens_available -= self._charge(request)
+            self._in_flight[request.priority] += 1
+            if request.priority == PRIORITY_BULK:
+                self._bulk_in_flight_by_job[request.job_id] += 1
+            request.wait_seconds = time.monotonic() - request.enqueued_at
+            self._wait_times[request.priority].append(request.wait_seconds)
+            request.granted.set()
+
+    def _remove(self, request: _ScheduledRequest):
+        """Drops a request that gave up before it was granted. Must be called with the lock held."""
+        if request.priority == PRIORITY_INTERACTIVE:
+            self._interactive_queue.remove(request)
+        else:
+            queue = self._bulk_queues[request.job_id]
+            queue.remove(request)
+            if not queue:
+                del self._bulk_queues[request.job_id]
+
+    @contextmanager
+    def slot(self, priority: str = PRIORITY_INTERACTIVE, job_id: Optional[str] = None, tokens: int = 0):
+        """Blocks until the request may be sent, then holds its slot for the duration of the call."""
+        if priority == PRIORITY_BULK:
+            job_id = job_id or "default"
+        request = _ScheduledRequest(priority, job_id, tokens)
+        with self._lock:
+            if priority == PRIORITY_INTERACTIVE:
+                self._interactive_queue.append(request)
+            else:
+                self._bulk_queues.setdefault(job_id, deque()).append(request)
+            self._dispatch()
+        try:
+            # Quota refills over time, so re-check periodically as well as on every release.
+            while not request.granted.wait(timeout=0.25):
+                with self._lock:
+                    self._dispatch()
+        except BaseException:
+            with self._lock:
+                if not request.granted.is_set():
+                    self._remove(request)
+                    raise
+            self.release(request)
+            raise
+        try:
+            yield request
+        finally:
+            self.release(request)
+
+    def release(self, request: _ScheduledRequest):
+        with self._lock:
+            self._in_flight[request.priority] -= 1
+            self._completed[request.priority] += 1
+            if request.priority == PRIORITY_BULK:
+                self._bulk_in_flight_by_job[request.job_id] -= 1
+                if not self._bulk_in_flight_by_job[request.job_id]:
+                    del self._bulk_in_flight_by_job[request.job_id]
+            self._dispatch()
+
+    def get_metrics(self) -> Dict[str, Any]:
+        """Returns queue depth, in-flight calls and recent wait times for each priority class."""
+        with self._lock:
+            self._refill()
+            metrics = {
+                "bulk_jobs_waiting": len(self._bulk_queues),
+                "active_bulk_jobs": len(set(self._bulk_queues) | set(self._bulk_in_flight_by_job)),
+                "requests_available": int(self._requests_available),
+                "tokens_available": int(self._tokens_available),
+            }
+            queue_depth = {
+                PRIORITY_INTERACTIVE: len(self._interactive_queue),
+                PRIORITY_BULK: sum(len(queue) for queue in self._bulk_queues.values()),
+            }
+            for priority, wait_times in self._wait_times.items():
+                waits = sorted(wait_times)
+                metrics[priority] = {
+                    "queue_depth": queue_depth[priority],
+                    "in_flight": self._in_flight[priority],
+                    "completed": self._completed[priority],
+                    "avg_wait_seconds": sum(waits) / len(waits) if waits else 0.0,
+                    "p95_wait_seconds": waits[math.ceil(0.95 * len(waits)) - 1] if waits else 0.0,
+                }
+            return metrics
+
+
+# One scheduler per process, shared by every Streamlit session.
+REQUEST_SCHEDULER = RequestScheduler(SCHEDULER_MAX_CONCURRENCY, AZURE_OPENAI_RPM_QUOTA, AZURE_OPENAI_TPM_QUOTA,
+                                     INTERACTIVE_RESERVE_SLOTS, INTERACTIVE_RESERVE_LOOKUPS,
+                                     INTERACTIVE_RESERVE_LOOKUPS * INTERACTIVE_LOOKUP_TOKENS)
 
 
 # --- HELPER FUNCTIONS ---
 
 def load_hsn_tariff_data():
     """Loads the HSN tariff data from a CSV file into a global DataFrame."""
-    global HSN_TARIFF_DATA
+    global HSN_TARIFF_DATA, HSN_DESC_LOOKUP
     if not os.path.exists(HSN_TARIFF_CSV_PATH):
         print(f"Error: HSN tariff CSV file not found at '{HSN_TARIFF_CSV_PATH}'.")
         print("Please update the HSN_TARIFF_CSV_PATH variable in the script.")
         return False
     try:
         HSN_TARIFF_DATA = pd.read_csv(HSN_TARIFF_CSV_PATH, dtype=str)
+        # First description per HSN code, so lookups don't scan the whole tariff every time.
+        first_rows = HSN_TARIFF_DATA.dropna(subset=["hsn"]).drop_duplicates(subset="hsn", keep="first")
+        HSN_DESC_LOOKUP = dict(zip(first_rows["hsn"], first_rows["desc"]))
         print(f"HSN tariff data loaded from '{HSN_TARIFF_CSV_PATH}'.")
         return True
     except Exception as e:
@@ -57,10 +278,7 @@ def get_hsn_description(hsn_code: str) -> str:
     descriptions = []
 
     def find_desc(code):
-        try:
-            return HSN_TARIFF_DATA.loc[HSN_TARIFF_DATA["hsn"] == code, 'desc'].iloc[0]
-        except (IndexError, KeyError):
-            return None
+        return HSN_DESC_LOOKUP.get(code)
 
     desc_8 = find_desc(hsn_code[:8])
     if desc_8: descriptions.append(desc_8)
@@ -87,8 +305,8 @@ def process_rule_book(excel_path: str, json_path: str):
         print(f"An error occurred while processing the Excel file: {e}")
 
 
-def get_azure_openai_response(prompt: str) -> str:
-    """Calls the Azure OpenAI API with the given prompt."""
+def get_azure_openai_response(prompt: str, priority: str = PRIORITY_INTERACTIVE, job_id: Optional[str] = None) -> str:
+    """Calls the Azure OpenAI API with the given prompt, queued through the shared request scheduler."""
     if "YOUR_AZURE" in AZURE_OPENAI_API_KEY or not all(
             [AZURE_OPENAI_API_KEY, AZURE_OPENAI_ENDPOINT, AZURE_OPENAI_DEPLOYMENT_NAME]):
         return "Error: Azure OpenAI credentials are not configured. Please update the configuration section."
@@ -98,10 +316,13 @@ def get_azure_openai_response(prompt: str) -> str:
         "messages": [{"role": "system",
                       "content": "You are an expert on tax and ITC classification. You must provide a clear 'Yes' or 'No' answer, followed by a brief justification."},
                      {"role": "user", "content": prompt}],
-        "temperature": 0.0, "max_tokens": 500
+        "temperature": 0.0, "max_tokens": AZURE_OPENAI_MAX_TOKENS
     }
+    # Azure counts max_tokens against the TPM quota up front, so reserve it here too.
+    tokens = math.ceil(len(prompt) / CHARS_PER_TOKEN) + AZURE_OPENAI_MAX_TOKENS
     try:
-        response = requests.post(url, headers=headers, json=payload, timeout=90)
+        with REQUEST_SCHEDULER.slot(priority, job_id, tokens):
+            response = requests.post(url, headers=headers, json=payload, timeout=90)
         response.raise_for_status()
         return response.json()['choices'][0]['message']['content'].strip()
     except requests.exceptions.RequestException as e:
@@ -109,17 +330,7 @@ def get_azure_openai_response(prompt: str) -> str:
         return f"Error: API call failed. Details: {e}"
 
 
-def get_classification_for_item(item_data: pd.Series, rules: List[Dict[str, Any]]) -> str:
-    """Constructs your preferred prompt and gets the classification string for a single item."""
-    material_description = item_data.get('Material Description', 'N/A')
-    product_hsn = item_data.get('HSN Code', 'N/A')
-    nature_transaction = item_data.get('Nature of Transaction', 'N/A')
-    capital_goods = item_data.get('Capital Goods', 'N/A')
-    gst_status = item_data.get('GST Statuss', 'N/A')
-    hsn_description = get_hsn_description(str(product_hsn))
-    rules_text = json.dumps(rules, indent=2)
-
-    prompt = f"""
+CLASSIFICATION_PROMPT_TEMPLATE = """
         You are an expert on tax and Input Tax Credit (ITC) classification. Your task is to determine the eligibility of ITC for a given item. We are doing it for port operator and logistics company - Ports & Terminals - Cargo handling expertise.
         First, you must use the provided set of rules. If a definitive classification cannot be made using these rules, you may then use your extensive knowledge of GST laws, including Indian Trade Classification (ITC-HS) and Section 17(5) of the CGST Act, to provide the most accurate assessment.
         RULES:
@@ -184,7 +395,31 @@ def get_classification_for_item(item_data: pd.Series, rules: List[Dict[str, Any]
         2. [Second question]
         3. [Third question]
         """
-    return get_azure_openai_response(prompt)
+
+# Input columns that feed the bulk prompt; duplicates on these produce identical prompts.
+PROMPT_INPUT_COLUMNS = ['Material Description', 'HSN Code', 'Nature of Transaction', 'Capital Goods']
+
+
+def build_classification_prompt(item_data: pd.Series, rules: List[Dict[str, Any]]) -> str:
+    """Builds the classification prompt for a single item of the bulk upload."""
+    material_description = item_data.get('Material Description', 'N/A')
+    product_hsn = item_data.get('HSN Code', 'N/A')
+    nature_transaction = item_data.get('Nature of Transaction', 'N/A')
+    capital_goods = item_data.get('Capital Goods', 'N/A')
+    hsn_description = get_hsn_description(str(product_hsn))
+    rules_text = json.dumps(rules, indent=2)
+
+    return CLASSIFICATION_PROMPT_TEMPLATE.format(
+        rules_text=rules_text, material_description=material_description,
+        hsn_description=hsn_description, nature_transaction=nature_transaction,
+        capital_goods=capital_goods
+    )
+
+
+def get_classification_for_item(item_data: pd.Series, rules: List[Dict[str, Any]], job_id: Optional[str] = None) -> str:
+    """Constructs your preferred prompt and gets the classification string for a single bulk item."""
+    prompt = build_classification_prompt(item_data, rules)
+    return get_azure_openai_response(prompt, priority=PRIORITY_BULK, job_id=job_id)
 
 
 # ==============================================================================
@@ -323,9 +558,124 @@ def parse_ai_response_original(response_text: str) -> Dict[str, str]:
     return parsed_data
 
 
+# --- BULK INPUT HELPERS ---
+
+def load_bulk_rules():
+    """Loads the rules used for bulk classification, or returns None if they are missing."""
+    if not os.path.exists(BULK_RULES_JSON_PATH):
+        print(f"Error: Rules file '{BULK_RULES_JSON_PATH}' not found.")
+        return None
+    print(f"Loading rules from '{BULK_RULES_JSON_PATH}'...")
+    with open(BULK_RULES_JSON_PATH, 'r') as f:
+        return json.load(f)
+
+
+def read_bulk_input(input_file):
+    """Reads the uploaded bulk CSV into a DataFrame, or returns None if it can't be read."""
+    print(f"Loading input data from '{input_file}'...")
+    # The same upload is read by the estimate and then by the run, so rewind it first.
+    if hasattr(input_file, "seek"):
+        input_file.seek(0)
+    try:
+        # Use dtype=str to prevent pandas from auto-interpreting types like HSN codes
+        return pd.read_csv(input_file, dtype=str, encoding='iso-8859-1').fillna('N/A')
+    except Exception as e:
+        print(f"Failed to read input Excel file: {e}")
+        return None
+
+
+# --- PRE-FLIGHT ESTIMATE ---
+
+def _project_bulk_run(calls: int, prompt_tokens: int, other_bulk_jobs: int = 0) -> Dict[str, Any]:
+    """
+    Predicts tokens, wall-clock time and cost for a bulk run of the given size.
+    Bulk jobs take turns, so the time is stretched as if the other active jobs run throughout.
+    """
+    completion_tokens = calls * min(EST_COMPLETION_TOKENS, AZURE_OPENAI_MAX_TOKENS)
+    total_tokens = prompt_tokens + completion_tokens
+
+    # The scheduler charges every call its prompt plus the full max_tokens against TPM.
+    quota_tokens = prompt_tokens + calls * AZURE_OPENAI_MAX_TOKENS
+
+    # Wall-clock time is set by whichever is slowest: call latency, token quota or request quota.
+    # The interactive reserve is a floor on the budget, not a share of the rate: bulk first
+    # spends the budget above the floor in one burst, then gets the whole per-minute refill.
+    scheduler = REQUEST_SCHEDULER
+    bulk_slots = min(BULK_CONCURRENCY, scheduler.bulk_max_concurrency)
+    time_bounds = {
+        "latency": calls * AZURE_OPENAI_AVG_LATENCY_SECONDS / bulk_slots,
+        "token quota": max(0, quota_tokens - scheduler.bulk_tpm_quota) / scheduler.tpm_quota * 60,
+        "request quota": max(0, calls - scheduler.bulk_rpm_quota) / scheduler.rpm_quota * 60,
+    }
+    limited_by = max(time_bounds, key=time_bounds.get)
+
+    return {
+        "calls": calls,
+        "prompt_tokens": prompt_tokens,
+        "completion_tokens": completion_tokens,
+        "total_tokens": total_tokens,
+        "estimated_seconds": time_bounds[limited_by] * (other_bulk_jobs + 1),
+        "limited_by": limited_by,
+        "estimated_cost_usd": (prompt_tokens / 1000 * PROMPT_COST_PER_1K_TOKENS
+                               + completion_tokens / 1000 * COMPLETION_COST_PER_1K_TOKENS),
+    }
+
+
+def estimate_bulk_sample(estimate: Dict[str, Any], sample_size: int) -> Dict[str, Any]:
+    """Scales a full-file estimate from estimate_bulk_run down to a random sample of rows."""
+    calls = min(int(sample_size), estimate["total_rows"])
+    prompt_tokens = int(round(estimate["mean_prompt_tokens"] * calls))
+    return {**estimate, **_project_bulk_run(calls, prompt_tokens, estimate["other_bulk_jobs"])}
+
+
+def estimate_bulk_run(input_file) -> Optional[Dict[str, Any]]:
+    """
+    Dry run of a bulk upload. Counts the items and predicts the calls, tokens, wall-clock
+    time and cost of classifying them, without calling the model.
+    Prompt tokens are approximated from prompt length (CHARS_PER_TOKEN), computed column-wise.
+    """
+    if HSN_TARIFF_DATA is None and not load_hsn_tariff_data(): return None
+    rules = load_bulk_rules()
+    if rules is None: return None
+    df = read_bulk_input(input_file)
+    if df is None: return None
+
+    # Same fields and defaults as build_classification_prompt.
+    items = df.reindex(columns=PROMPT_INPUT_COLUMNS, fill_value='N/A').astype(str)
+    total_rows = len(items)
+    unique_items = len(items.drop_duplicates())
+
+    # Every prompt shares the template text and the rules block; only the item fields vary.
+    field_counts = Counter(name for _, name, _, _ in string.Formatter().parse(CLASSIFICATION_PROMPT_TEMPLATE) if name)
+    fixed_chars = len(CLASSIFICATION_PROMPT_TEMPLATE.format(**{name: '' for name in field_counts}))
+    fixed_chars += field_counts['rules_text'] * len(json.dumps(rules, indent=2))
+
+    hsn_codes = items['HSN Code']
+    hsn_desc_chars = {code: len(get_hsn_description(code)) for code in hsn_codes.unique()}
+    prompt_chars = (fixed_chars
+                    + field_counts['material_description'] * items['Material Description'].str.len()
+                    + field_counts['hsn_description'] * hsn_codes.map(hsn_desc_chars)
+                    + field_counts['nature_transaction'] * items['Nature of Transaction'].str.len()
+                    + field_counts['capital_goods'] * items['Capital Goods'].str.len())
+    prompt_tokens_per_item = np.ceil(prompt_chars / CHARS_PER_TOKEN)
+
+    mean_prompt_tokens = float(prompt_tokens_per_item.mean()) if total_rows else 0.0
+    other_bulk_jobs = REQUEST_SCHEDULER.get_metrics()["active_bulk_jobs"]
+
+    # The bulk loop makes one call per row, duplicates included.
+    return {
+        "total_rows": total_rows,
+        "unique_items": unique_items,
+        "mean_prompt_tokens": mean_prompt_tokens,
+        "avg_prompt_tokens": int(round(mean_prompt_tokens)),
+        "other_bulk_jobs": other_bulk_jobs,
+        **_project_bulk_run(total_rows, int(prompt_tokens_per_item.sum()), other_bulk_jobs),
+    }
+
+
 # --- MAIN LOGIC ---
 
-def classify_itc_from_excel(INPUT_DATA_EXCEL_PATH):
+def classify_itc_from_excel(INPUT_DATA_EXCEL_PATH, sample_size: Optional[int] = None):
     if not load_hsn_tariff_data(): return
 
 
@@ -333,34 +683,26 @@ def classify_itc_from_excel(INPUT_DATA_EXCEL_PATH):
     """Main function to load data, classify each item, and save results."""
     #downloadfolder=os.path.join(os.path.join(os.environ['USERPROFILE']), 'Downloads')
     OUTPUT_DATA_EXCEL_PATH=os.path.join("classified_output.xlsx")
-    PROCESSED_RULES_JSON_PATH=os.path.join(os.getcwd(),"Rules")
-    PROCESSED_RULES_JSON_PATH=os.path.join(PROCESSED_RULES_JSON_PATH,"rules.json")
-    if not os.path.exists(PROCESSED_RULES_JSON_PATH): print(
-        f"Error: Rules file '{PROCESSED_RULES_JSON_PATH}' not found."); return
-
-
-    print(f"Loading rules from '{PROCESSED_RULES_JSON_PATH}'...")
-    with open(PROCESSED_RULES_JSON_PATH, 'r') as f:
-        rules = json.load(f)
+    rules = load_bulk_rules()
+    if rules is None: return
 
-    print(f"Loading input data from '{INPUT_DATA_EXCEL_PATH}'...")
-    try:
-        # Use dtype=str to prevent pandas from auto-interpreting types like HSN codes
-        df = pd.read_csv(INPUT_DATA_EXCEL_PATH, dtype=str,encoding='iso-8859-1').fillna('N/A')
-    except Exception as e:
-        print(f"Failed to read input Excel file: {e}");
+    df = read_bulk_input(INPUT_DATA_EXCEL_PATH)
+    if df is None:
         return "fail to upload file"
 
-    parsed_results = []
+    if sample_size and sample_size < len(df):
+        print(f"Classifying a sample of {sample_size} of {len(df)} rows.")
+        df = df.sample(n=sample_size, random_state=0).sort_index()
+
     total_rows = len(df)
-    print(f"\nStarting classification for {total_rows} items...")
+    # Each bulk run is its own job, so concurrent uploads share the bulk quota fairly.
+    job_id = uuid.uuid4().hex
+    print(f"\nStarting classification for {total_rows} items (job {job_id})...")
 
-    for index, row in df.iterrows():
-        print(f"--- Processing row {index + 1}/{total_rows}: {row.get('Material Description', 'N/A')} ---")
+    def classify_row(position, row):
+        print(f"--- Processing row {position}/{total_rows}: {row.get('Material Description', 'N/A')} ---")
 
-        raw_result = get_classification_for_item(row, rules)
-        import time
-        time.sleep(0.2)
+        raw_result = get_classification_for_item(row, rules, job_id=job_id)
 
         print("--- RAW AI RESPONSE (for debugging) ---")
         print(raw_result)
@@ -368,10 +710,30 @@ def classify_itc_from_excel(INPUT_DATA_EXCEL_PATH):
 
         # *** CALLING THE NEW, REVISED PARSING FUNCTION ***
         parsed_data = parse_ai_response_revised(raw_result)
-        parsed_results.append(parsed_data)
 
         print(f"  - Parsed Answer: {parsed_data.get('Answer', 'N/A')}")
         print(f"  - Parsed Justification: {parsed_data.get('Justification', 'N/A')[:70]}...")  # Print first 70 chars
+        return parsed_data
+
+    # The scheduler paces the calls; the workers just keep the bulk slots busy.
+    executor = ThreadPoolExecutor(max_workers=BULK_CONCURRENCY)
+    # Number rows by position, since a sample keeps the original file's index.
+    futures = [executor.submit(classify_row, position, row)
+               for position, (_, row) in enumerate(df.iterrows(), start=1)]
+    # Streamlit only raises its stop/rerun exception inside st calls, so the progress bar
+    # update after each row is also what lets the user stop the job.
+    progress_bar = st.progress(0.0, text="Classifying rows...")
+    parsed_results = []
+    try:
+        for future in futures:
+            parsed_results.append(future.result())
+            progress_bar.progress(len(parsed_results) / total_rows,
+                                  text=f"Classified {len(parsed_results)}/{total_rows} rows")
+    except BaseException:
+        # Drop the rows not yet sent so an abandoned job doesn't keep using the deployment's quota.
+        executor.shutdown(wait=False, cancel_futures=True)
+        raise
+    executor.shutdown()
 
     print("\nCombining results with input data...")
     results_df = pd.DataFrame(parsed_results).rename(columns={
@@ -42,6 +42,19 @@ h1 {
 """, unsafe_allow_html=True)
 
 
+# --- Azure OpenAI Queue ---
+# Snapshot of the shared request scheduler, taken on every rerun
+queue_metrics = ITC_classifier.REQUEST_SCHEDULER.get_metrics()
+st.sidebar.header("Azure OpenAI Queue")
+for priority, label in ((ITC_classifier.PRIORITY_INTERACTIVE, "Interactive"), (ITC_classifier.PRIORITY_BULK, "Bulk")):
+    st.sidebar.subheader(label)
+    st.sidebar.metric("Queue depth", queue_metrics[priority]["queue_depth"])
+    st.sidebar.metric("In flight", queue_metrics[priority]["in_flight"])
+    st.sidebar.metric("Avg / p95 wait", f"{queue_metrics[priority]['avg_wait_seconds']:.1f}s / "
+                                        f"{queue_metrics[priority]['p95_wait_seconds']:.1f}s")
+st.sidebar.caption(f"Bulk jobs waiting: {queue_metrics['bulk_jobs_waiting']}")
+
+
 # --- Main Application ---
 st.title("ITC Classification Assistance")
 st.markdown("---")
@@ -118,25 +131,71 @@ if download_template_button:
 
 # --- (Optional) Submit button for the single entry ---
 
+def run_bulk_classification(sample_size=None):
+    st.success(f" Please hold on ..  we are processing..")
+    with st.spinner("Processing... Please wait."):
+        time.sleep(5)
+    resp=ITC_classifier.classify_itc_from_excel(uploaded_file, sample_size=sample_size)
+    if resp=='success':
+        st.success(f"Amigo friend, File is ready in your download folder..enjoy!!.", icon="🎉")
+    else:
+        st.warning("something went wrong")
+
+
 if st.button("Upload bulk data"):
     if uploaded_file:
-        st.success(f" Please hold on ..  we are processing..")
-        with st.spinner("Processing... Please wait."):
-            time.sleep(5)
-        resp=ITC_classifier.classify_itc_from_excel(uploaded_file)
-        if resp=='success':
-            st.success(f"Amigo friend, File is ready in your download folder..enjoy!!.", icon="🎉")
-        else:
+        # Dry run first, so the user sees what the full run will cost before any calls are made
+        with st.spinner("Estimating cost and time..."):
+            estimate = ITC_classifier.estimate_bulk_run(uploaded_file)
+        if estimate is None:
             st.warning("something went wrong")
-
-
-
-
-        
+        else:
+            st.session_state["bulk_estimate"] = estimate
+            st.session_state["bulk_estimate_file"] = uploaded_file.file_id
         # Add your classification logic here
     else:
         st.warning("Please fill in all the details before submitting.")
 
+# Drop a stale estimate if the file was removed or replaced (file_id changes even for the same name)
+if uploaded_file is None or st.session_state.get("bulk_estimate_file") != uploaded_file.file_id:
+    st.session_state.pop("bulk_estimate", None)
+
+if "bulk_estimate" in st.session_state:
+    estimate = st.session_state["bulk_estimate"]
+    st.subheader("Estimated Cost and Time")
+    est_col1, est_col2, est_col3 = st.columns(3)
+    est_col1.metric("Rows / Unique items", f"{estimate['total_rows']:,} / {estimate['unique_items']:,}")
+    est_col2.metric("API calls", f"{estimate['calls']:,}")
+    est_col3.metric("Total tokens", f"{estimate['total_tokens']:,}")
+    est_col1.metric("Prompt tokens per item", f"{estimate['avg_prompt_tokens']:,}")
+    est_col2.metric("Estimated time", f"{estimate['estimated_seconds'] / 60:,.1f} min")
+    est_col3.metric("Estimated cost", f"${estimate['estimated_cost_usd']:,.2f}")
+    if estimate['other_bulk_jobs']:
+        load_note = (f"Assumes the {estimate['other_bulk_jobs']} other bulk job(s) running at estimate time "
+                     f"keep sharing the deployment for the whole run.")
+    else:
+        load_note = "Assumes no other bulk jobs start during the run."
+    st.caption(f"Time is limited by {estimate['limited_by']}. {load_note} Token counts are approximate.")
+
+    sample_size = st.number_input("Sample size", min_value=1, max_value=max(estimate['total_rows'], 1),
+                                  value=min(50, max(estimate['total_rows'], 1)), step=1)
+    sample_estimate = ITC_classifier.estimate_bulk_sample(estimate, sample_size)
+    st.caption(f"Sample of {sample_estimate['calls']:,} rows: ~{sample_estimate['total_tokens']:,} tokens, "
+               f"~{sample_estimate['estimated_seconds'] / 60:,.1f} min, ~${sample_estimate['estimated_cost_usd']:,.2f}")
+    run_col1, run_col2, run_col3 = st.columns(3)
+    run_full = run_col1.button("Run full file")
+    run_sample = run_col2.button("Run sample")
+    cancel_run = run_col3.button("Cancel")
+    if run_full:
+        st.session_state.pop("bulk_estimate", None)
+        run_bulk_classification()
+    elif run_sample:
+        st.session_state.pop("bulk_estimate", None)
+        run_bulk_classification(sample_size=int(sample_size))
+    elif cancel_run:
+        st.session_state.pop("bulk_estimate", None)
+        st.info("Bulk upload cancelled. No calls were made.")
+
 
 st.markdown("---")
 